@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'OPDC'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sIQ')
+
+COLUMN_TYPES = {
+    'q': 'int64',
+    'd': 'float64'
+}
+
+TYPE_CODES = {
+    'int64': 'q',
+    'float64': 'd'
+}
+
+def align(n, alignment=8):
+    return (n + alignment - 1) // alignment * alignment
+
+def encode_strings(values):
+
+    offsets = array('q', [0])
+    blob = bytearray()
+    for value in values:
+        blob.extend(value.encode('utf-8'))
+        offsets.append(len(blob))
+
+    return offsets, blob
+
+def check_column_names(names, path=None):
+
+    seen = set()
+    for name in names:
+        if name in seen:
+            raise ValueError(f'{path}: Duplicate column name {name}' if path is not None else f'Duplicate column name {name}')
+        seen.add(name)
+
+def write_columnar(fd, meta, names, columns, rows):
+
+    check_column_names(names)
+    sections = []
+    layout = []
+    offset = 0
+
+    def add_section(data):
+        nonlocal offset
+        sections.append((offset, data))
+        length = len(data) if isinstance(data, (bytes, bytearray)) else len(data) * data.itemsize
+        section = { 'offset': offset, 'length': length }
+        offset = align(offset + length)
+        return section
+
+    for name, column in zip(names, columns):
+        if isinstance(column, array):
+            layout.append({ 'name': name, 'type': COLUMN_TYPES[column.typecode], 'data': add_section(column) })
+        else:
+            offsets, blob = encode_strings(column)
+            layout.append({ 'name': name, 'type': 'string', 'offsets': add_section(offsets), 'data': add_section(blob) })
+
+    header = json.dumps({
+        'meta': meta,
+        'rows': rows,
+        'byteorder': sys.byteorder,
+        'columns': layout
+    }, ensure_ascii=False).encode('utf-8')
+
+    base = align(PREAMBLE.size + len(header))
+    fd.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+    fd.write(header)
+    fd.write(b'\0' * (base - PREAMBLE.size - len(header)))
+
+    position = 0
+    for section_offset, data in sections:
+        fd.write(b'\0' * (section_offset - position))
+        fd.write(data)
+        position = section_offset + (len(data) if isinstance(data, (bytes, bytearray)) else len(data) * data.itemsize)
+
+class StringColumn():
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n = n + len(self)
+        if n < 0 or n >= len(self):
+            raise IndexError('column index out of range')
+        return str(self.blob[self.offsets[n]:self.offsets[n + 1]], 'utf-8')
+
+    def __iter__(self):
+        for n in range(0, len(self)):
+            yield self[n]
+
+class ColumnarFile():
+
+    def __init__(self, path):
+        self.fd = open(path, 'rb')
+        self.mm = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mm)
+
+        magic, version, header_length = PREAMBLE.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path}: Not a columnar file')
+
+        header = json.loads(str(self.buffer[PREAMBLE.size:PREAMBLE.size + header_length], 'utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError(f'{path}: Unsupported byte order {header["byteorder"]}')
+
+        try:
+            check_column_names([column['name'] for column in header['columns']], path)
+        except ValueError:
+            self.close()
+            raise
+
+        self.base = align(PREAMBLE.size + header_length)
+        self.meta = header['meta']
+        self.rows = header['rows']
+        self.layout = { column['name']: column for column in header['columns'] }
+        self.names = [column['name'] for column in header['columns']]
+
+    def section(self, section):
+        start = self.base + section['offset']
+        return self.buffer[start:start + section['length']]
+
+    def column(self, name):
+        column = self.layout[name]
+        if column['type'] == 'string':
+            return StringColumn(self.section(column['offsets']).cast('q'), self.section(column['data']))
+        else:
+            return self.section(column['data']).cast(TYPE_CODES[column['type']])
+
+    def numpy(self, name):
+        import numpy
+        column = self.layout[name]
+        if column['type'] == 'string':
+            raise ValueError(f'{name}: String column has no numpy representation')
+        return numpy.frombuffer(self.mm, dtype=TYPE_CODES[column['type']], count=self.rows, offset=self.base + column['data']['offset'])
+
+    def close(self):
+        self.buffer.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+        self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def open_columnar(path):
+    return ColumnarFile(path)
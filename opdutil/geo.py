@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def get_region(kind, region_exp):
+
+    try:
+        values = list(map(float, region_exp.split(',')))
+    except ValueError:
+        return None
+
+    if kind == 'bbox' and len(values) == 4:
+        south, west, north, east = values
+        if south > north or west > east:
+            return None
+        return { 'kind': kind, 'label': f'{kind}:{region_exp}', 'bounds': (south, west, north, east) }
+    elif kind == 'radius' and len(values) == 3:
+        lat, lon, km = values
+        if km < 0:
+            return None
+        dlat = math.degrees(km / EARTH_RADIUS_KM)
+        coslat = math.cos(math.radians(lat))
+        dlon = math.degrees(km / (EARTH_RADIUS_KM * coslat)) if coslat > 1e-9 else 180.0
+        bounds = (lat - dlat, max(lon - dlon, -180.0), lat + dlat, min(lon + dlon, 180.0))
+        return { 'kind': kind, 'label': f'{kind}:{region_exp}', 'center': (lat, lon), 'km': km, 'bounds': bounds }
+    else:
+        return None
+
+class GridIndex():
+
+    def __init__(self, latitudes, longitudes, cell_size=0.1):
+        self.cell_size = cell_size
+        self.latitudes = []
+        self.longitudes = []
+        self.cells = {}
+        for n, (lat, lon) in enumerate(zip(latitudes, longitudes)):
+            try:
+                lat = float(lat)
+                lon = float(lon)
+            except (ValueError, TypeError):
+                lat = lon = math.nan
+            self.latitudes.append(lat)
+            self.longitudes.append(lon)
+            if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+                self.cells.setdefault(self.cell(lat, lon), []).append(n)
+
+    def cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def candidates(self, south, west, north, east):
+
+        y0, x0 = self.cell(south, west)
+        y1, x1 = self.cell(north, east)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self.cells):
+            cells = [v for (y, x), v in self.cells.items() if y0 <= y <= y1 and x0 <= x <= x1]
+        else:
+            cells = [self.cells[(y, x)] for y in range(y0, y1 + 1) for x in range(x0, x1 + 1) if (y, x) in self.cells]
+
+        for numbers in cells:
+            yield from numbers
+
+    def bbox(self, south, west, north, east):
+
+        found = []
+        for n in self.candidates(south, west, north, east):
+            if south <= self.latitudes[n] <= north and west <= self.longitudes[n] <= east:
+                found.append(n)
+
+        return sorted(found)
+
+    def radius(self, lat, lon, km, bounds=None):
+
+        if bounds is None:
+            bounds = get_region('radius', f'{lat},{lon},{km}')['bounds']
+
+        found = []
+        for n in self.candidates(*bounds):
+            if haversine(lat, lon, self.latitudes[n], self.longitudes[n]) <= km:
+                found.append(n)
+
+        return sorted(found)
+
+    def query(self, region):
+
+        if region['kind'] == 'bbox':
+            return self.bbox(*region['bounds'])
+        else:
+            return self.radius(*region['center'], region['km'], bounds=region['bounds'])
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import errno
+import os
+import sys
+from opdutil.columnar import write_columnar
+from opdutil.modules.base import BasePostProcess
+from opdutil.opddetect import columnnumber2exp
+
+class PostProcess(BasePostProcess):
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.directory = args.directory if args.directory is not None else '.'
+        self.suffix = args.suffix if args.suffix is not None else '.opdc'
+        self.overwrite = args.overwrite is not None and args.overwrite.lower() not in ['false', 'no', '0']
+
+    def list_argument_names(self):
+        return ['directory', 'suffix', 'overwrite']
+
+    def get_column_names(self, collected, width):
+
+        header = collected['header']
+        if header is not None:
+            names = header['items'][2:]
+        else:
+            names = [columnnumber2exp(n) for n in range(0, width)]
+
+        unique_names = []
+        for name in names:
+            unique_name = name
+            n = 2
+            while unique_name in unique_names or unique_name == 'id':
+                unique_name = f'{name}~{n}'
+                n = n + 1
+            unique_names.append(unique_name)
+
+        return unique_names
+
+    def generate_columnar_file(self, collected):
+
+        meta = collected['dataset']['meta']
+        selection = collected['selection']
+        typed_columns = collected.get('columns')
+
+        width = max(map(lambda x: len(x) - 2, selection), default=0)
+        names = ['id'] + self.get_column_names(collected, width)
+
+        columns = [[vector[1] for vector in selection]]
+        for n in range(0, width):
+            if typed_columns is not None and n < len(typed_columns) and typed_columns[n] is not None:
+                columns.append(typed_columns[n])
+            else:
+                columns.append([vector[n + 2] if n + 2 < len(vector) else '' for vector in selection])
+
+        path = os.path.join(self.directory, f'{meta["id"]}{self.suffix}')
+        with open(path, 'wb' if self.overwrite is True else 'xb') as fd:
+            write_columnar(fd, {
+                'id': meta['id'],
+                'name': meta['name'],
+                'filename': meta['filename']
+            }, names, columns, len(selection))
+
+    def selected(self, collection):
+
+        ret = 0
+        for collected in collection:
+            if ret == 0:
+                ret = collected['status']
+            if collected['selection'] is not None:
+                try:
+                    self.generate_columnar_file(collected)
+                except OSError as e:
+                    print(e, file=sys.stderr)
+                    if ret == 0:
+                        ret = e.errno if e.errno is not None else errno.EIO
+                except ValueError as e:
+                    print(e, file=sys.stderr)
+                    if ret == 0:
+                        ret = errno.EINVAL
+
+        return ret
+
+    def detected(self, collection):
+
+        return 1
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import json
+import sys
 from opdutil.modules.base import BasePostProcess
 
 class PostProcess(BasePostProcess):
@@ -31,6 +32,7 @@ class PostProcess(BasePostProcess):
                 ret = collected['status']
             if collected['selection'] is not None:
                 self.print_items(collected['selection'])
+                sys.stdout.flush()
 
         return ret
 
@@ -42,5 +44,6 @@ class PostProcess(BasePostProcess):
                 ret = collected['status']
             if collected['header'] is not None:
                 self.print_items([collected['header']['items']])
+                sys.stdout.flush()
 
         return ret
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import csv
+import hashlib
+import json
+import math
+import sys
+from opdutil.modules.base import BasePostProcess
+from opdutil.opddetect import columnnumber2exp
+
+class HyperLogLog():
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        self.shift = 64 - precision
+        self.mask = (1 << self.shift) - 1
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+        index = h >> self.shift
+        rank = self.shift - (h & self.mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+class SpaceSaving():
+
+    def __init__(self, capacity=40):
+        self.capacity = capacity
+        self.counters = {}
+
+    def add(self, value):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] = counter[0] + 1
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [1, 0]
+        else:
+            victim = min(self.counters, key=lambda x: self.counters[x][0])
+            count, _ = self.counters.pop(victim)
+            self.counters[value] = [count + 1, count]
+
+    def top(self, k):
+        ranking = sorted(self.counters.items(), key=lambda x: -x[1][0])[:k]
+        return [(value, count - error) for value, (count, error) in ranking]
+
+class ColumnProfile():
+
+    def __init__(self, name, precision, capacity):
+        self.name = name
+        self.count = 0
+        self.null = 0
+        self.empty = 0
+        self.numeric = 0
+        self.number_min = None
+        self.number_max = None
+        self.text_min = None
+        self.text_max = None
+        self.distinct = HyperLogLog(precision)
+        self.frequent = SpaceSaving(capacity)
+
+    def add(self, value):
+        self.count = self.count + 1
+        if value is None:
+            self.null = self.null + 1
+            return
+        if len(value) == 0:
+            self.empty = self.empty + 1
+            return
+
+        self.distinct.add(value)
+        self.frequent.add(value)
+
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+        if number is not None and not math.isnan(number):
+            self.numeric = self.numeric + 1
+            if self.number_min is None or number < self.number_min:
+                self.number_min = number
+            if self.number_max is None or number > self.number_max:
+                self.number_max = number
+        else:
+            if self.text_min is None or value < self.text_min:
+                self.text_min = value
+            if self.text_max is None or value > self.text_max:
+                self.text_max = value
+
+    def result(self, k):
+        filled = self.count - self.null - self.empty
+        return {
+            'column': self.name,
+            'count': self.count,
+            'null': self.null,
+            'empty': self.empty,
+            'numeric_ratio': round(self.numeric / filled, 4) if filled > 0 else 0.0,
+            'number_min': self.number_min,
+            'number_max': self.number_max,
+            'text_min': self.text_min,
+            'text_max': self.text_max,
+            'distinct': self.distinct.count(),
+            'top': [[value, count] for value, count in self.frequent.top(k)]
+        }
+
+class PostProcess(BasePostProcess):
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.topk = int(args.topk) if args.topk is not None else 10
+        self.precision = int(args.precision) if args.precision is not None else 12
+        self.capacity = self.topk * 4
+
+    def list_argument_names(self):
+        return ['topk', 'precision']
+
+    def get_column_names(self, collected):
+
+        header = collected['header']
+        if header is not None:
+            return header['items'][2:]
+        else:
+            return None
+
+    def profile(self, collected):
+
+        meta = collected['dataset']['meta']
+        header = collected['header']
+        header_id = header['id'] if header is not None else None
+
+        names = self.get_column_names(collected)
+        profiles = []
+        rows = 0
+        for vector in collected['selection']:
+            if vector[1] == header_id:
+                continue
+            rows = rows + 1
+            width = len(vector) - 2
+            while len(profiles) < width:
+                n = len(profiles)
+                name = names[n] if names is not None and n < len(names) else columnnumber2exp(n)
+                profile = ColumnProfile(name, self.precision, self.capacity)
+                profile.count = rows - 1
+                profile.null = rows - 1
+                profiles.append(profile)
+            for n, profile in enumerate(profiles):
+                profile.add(vector[n + 2] if n < width else None)
+
+        return {
+            'id': meta['id'],
+            'name': meta['name'],
+            'filename': meta['filename'],
+            'rows': rows,
+            'columns': [profile.result(self.topk) for profile in profiles]
+        }
+
+    def print_profile(self, result):
+
+        if self.args.csv is True:
+            writer = csv.writer(sys.stdout, delimiter=self.args.delimiter[0], lineterminator='\n')
+            for column in result['columns']:
+                top = json.dumps(column['top'], ensure_ascii=False)
+                items = [
+                    result['id'], result['filename'], column['column'], column['count'], column['null'], column['empty'], column['numeric_ratio'],
+                    column['number_min'], column['number_max'], column['text_min'], column['text_max'], column['distinct'], top
+                ]
+                writer.writerow(map(lambda x: '' if x is None else str(x), items))
+        else:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    def selected(self, collection):
+
+        ret = 0
+        for collected in collection:
+            if ret == 0:
+                ret = collected['status']
+            if collected['selection'] is not None:
+                self.print_profile(self.profile(collected))
+                collected['selection'] = None
+
+        return ret
+
+    def detected(self, collection):
+
+        return 1
@@ -14,7 +14,7 @@ class PostProcess(BasePostProcess):
     def print(self, collection):
         print('-------- sample module: selected_post_process function --------')
         print('-------- collection --------')
-        pprint.pprint(collection)
+        pprint.pprint(list(collection))
         print('-------- args --------')
         pprint.pprint(self.args)
 
@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 
+import codecs
 import csv
 import errno
+import gzip
 import io
 import json
+import locale
 import os
 import re
 import sys
+import zipfile
 from bs4 import BeautifulSoup
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from importlib import import_module
 from itertools import zip_longest
+from operator import itemgetter
+from queue import Queue
+from threading import Thread
 
 def columnexp2number(c):
     if len(c) == 1:
@@ -50,17 +61,146 @@ def decode_record_id(record_id):
     k = record_id.split('-')
     return k[0], k[1]
 
-def create_dataset(csv_name, csv_path, prefix=None, encoding=None):
+def split_archive_path(csv_path):
+    m = re.match('^(.+?\.zip)!(.+)$', csv_path, re.IGNORECASE)
+    if m:
+        return m.group(1), m.group(2)
+    else:
+        return None, csv_path
+
+def is_zip_path(csv_path):
+    return csv_path.lower().endswith('.zip')
+
+def is_gzip_path(csv_path):
+    return csv_path.lower().endswith('.gz')
+
+def list_zip_members(zip_path):
+    with zipfile.ZipFile(zip_path) as zf:
+        return [name for name in zf.namelist() if name.lower().endswith('.csv')]
+
+def get_csv_size(csv_path):
+
+    archive_path, member = split_archive_path(csv_path)
+    if archive_path is not None:
+        with zipfile.ZipFile(archive_path) as zf:
+            return zf.getinfo(member).file_size
+    elif is_gzip_path(csv_path):
+        with open(csv_path, 'rb') as fd:
+            fd.seek(-4, os.SEEK_END)
+            return int.from_bytes(fd.read(4), 'little')
+    else:
+        return os.path.getsize(csv_path)
+
+@contextmanager
+def open_csv(csv_path, encoding=None):
+
+    archive_path, member = split_archive_path(csv_path)
+    if archive_path is not None:
+        with zipfile.ZipFile(archive_path) as zf:
+            with zf.open(member) as binary:
+                with io.TextIOWrapper(binary, encoding=encoding, newline='') as fd:
+                    yield fd
+    elif is_gzip_path(csv_path):
+        with gzip.open(csv_path, 'rt', encoding=encoding, newline='') as fd:
+            yield fd
+    else:
+        with open(csv_path, encoding=encoding, newline='') as fd:
+            yield fd
+
+def is_splittable_encoding(encoding=None):
+
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return False
+
+    if name.startswith(('utf-16', 'utf-32', 'utf-7', 'iso2022')):
+        return False
+    return '\n'.encode(encoding) == b'\n' and '"'.encode(encoding) == b'"'
+
+def find_record_boundaries(csv_path, chunk_size, block_size=1 << 24):
+
+    boundaries = [0]
+    target = chunk_size
+    pos = 0
+    quotes = 0
+    with open(csv_path, 'rb') as fd:
+        while True:
+            block = fd.read(block_size)
+            if len(block) == 0:
+                break
+
+            while target < pos + len(block):
+                start = max(target - pos, 0)
+                q = quotes + block.count(b'"', 0, start)
+                i = block.find(b'\n', start)
+                while i != -1:
+                    q = q + block.count(b'"', start, i)
+                    if q % 2 == 0:
+                        break
+                    start = i
+                    i = block.find(b'\n', i + 1)
+                if i == -1:
+                    target = pos + len(block)
+                    break
+                boundaries.append(pos + i + 1)
+                target = pos + i + 1 + chunk_size
 
-    with open(csv_path, encoding=encoding) as fd:
-        csv_text = fd.read()
+            quotes = quotes + block.count(b'"')
+            pos = pos + len(block)
 
-    csv_filename = os.path.basename(csv_path)
-    csv_basename = os.path.splitext(csv_filename)[0]
+    if boundaries[-1] < pos:
+        boundaries.append(pos)
+
+    return boundaries
+
+def is_header_candidate(record, header_hint):
+    return get_invalid_reason(record) is None and detect_header_columns(record, header_hint) is not None
+
+CHUNK_END = '\x1f'
+
+def parse_chunk(chunk, csv_path=None, encoding=None, where=None, keep_limit=0, clean=False, header_hint=None):
+
+    start, end = chunk
+    with open(csv_path, 'rb') as fd:
+        fd.seek(start)
+        csv_text = fd.read(end - start).decode(encoding if encoding is not None else locale.getpreferredencoding(False))
+    if not csv_text.endswith('\n'):
+        csv_text = csv_text + '\n'
+
+    count = 0
+    records = []
+    header_pending = header_hint is not None
+    rows = csv.reader(io.StringIO(csv_text + CHUNK_END, newline=''))
+    record = next(rows)
+    for next_record in rows:
+        matched = where is None or where(record)
+        header = header_pending and is_header_candidate(record, header_hint)
+        if header:
+            header_pending = False
+        if matched or header or count < keep_limit:
+            reason = get_invalid_reason(record) if clean is True else None
+            records.append((count, record, matched, reason, header))
+        count = count + 1
+        record = next_record
+
+    aligned = record == [CHUNK_END]
+    return count, records, aligned
+
+def create_dataset(csv_name, csv_path, prefix=None, encoding=None, where=None, keep=None, clean=False, jobs=None, chunk_size=None, header_hint=None):
+
+    _, member = split_archive_path(csv_path)
+    csv_filename = os.path.basename(member)
+    csv_basename = os.path.splitext(csv_filename[:-3] if is_gzip_path(csv_filename) else csv_filename)[0]
 
     if prefix is None:
         prefix = csv_basename
-        prefix = re.sub('-', '_', prefix)
+        member_directory = os.path.dirname(member) if member != csv_path else ''
+        if len(member_directory) > 0:
+            prefix = f'{member_directory}/{prefix}'
+        prefix = re.sub('[-/\\\\]', '_', prefix)
 
     meta = {
         'id': prefix,
@@ -70,43 +210,94 @@ def create_dataset(csv_name, csv_path, prefix=None, encoding=None):
         'basename': csv_basename
     }
 
-    rows = csv.reader(csv_text.splitlines())
-    data = {}
-    lno = 1
-    for row in rows:
-        record = []
-        for column in row:
-            record.append(column)
-        data.update({encode_record_id(prefix, lno): record})
-        lno = lno + 1
+    splittable = split_archive_path(csv_path)[0] is None and not is_gzip_path(csv_path) and is_splittable_encoding(encoding)
+    if chunk_size is not None and splittable and os.path.getsize(csv_path) > chunk_size:
+        boundaries = find_record_boundaries(csv_path, chunk_size)
+        chunks = list(zip(boundaries[:-1], boundaries[1:]))
+        keep_limit = max(keep) if keep is not None and len(keep) > 0 else 0
+        parse = partial(parse_chunk, csv_path=csv_path, encoding=encoding, where=where, keep_limit=keep_limit, clean=clean, header_hint=header_hint)
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = list(executor.map(parse, chunks))
+
+        if all(map(itemgetter(2), parsed)):
+            data = {}
+            kept = set()
+            base = 1
+            header_pending = header_hint is not None
+            for count, records, _ in parsed:
+                for n, record, matched, reason, header in records:
+                    lno = base + n
+                    if header and header_pending:
+                        header_pending = False
+                    else:
+                        header = False
+                    if matched or header or (keep is not None and lno in keep):
+                        if reason is not None:
+                            print(f'CSV #{lno:08}: {reason}', file=sys.stderr)
+                        else:
+                            data[encode_record_id(prefix, lno)] = record
+                            if not matched and not header:
+                                kept.add(encode_record_id(prefix, lno))
+                base = base + count
+        else:
+            print(f'{csv_filename}: Chunk boundary in quoted field, parsing serially', file=sys.stderr)
+            data = None
+        parsed = None
+    else:
+        data = None
+
+    if data is None:
+        data = {}
+        kept = set()
+        with open_csv(csv_path, encoding=encoding) as fd:
+            rows = csv.reader(fd)
+            lno = 1
+            header_pending = header_hint is not None
+            for record in rows:
+                header = header_pending and is_header_candidate(record, header_hint)
+                if header:
+                    header_pending = False
+                matched = where is None or where(record)
+                if matched or header or (keep is not None and lno in keep):
+                    reason = get_invalid_reason(record) if clean is True else None
+                    if reason is not None:
+                        print(f'CSV #{lno:08}: {reason}', file=sys.stderr)
+                    else:
+                        data[encode_record_id(prefix, lno)] = record
+                        if not matched and not header:
+                            kept.add(encode_record_id(prefix, lno))
+                lno = lno + 1
 
     return {
         'meta': meta,
-        'data': data
+        'data': data,
+        'kept': kept
     }
 
+def get_invalid_reason(record):
+
+    if len(record) == 0:
+        return 'No columns'
+
+    if record[0].startswith('#'):
+        return 'Comment record'
+
+    for column in record:
+        if len(column) > 0:
+            return None
+    else:
+        return 'Empty record'
+
 def remove_invalid_records(ds):
 
     removing_keys = []
     for id, record in ds['data'].items():
         lno = id.split('-')[1]
-        if len(record) == 0:
-            print(f'CSV #{lno}: No columns', file=sys.stderr)
-            removing_keys.append(id)
-            continue
-
-        if record[0].startswith('#'):
-            print(f'CSV #{lno}: Comment record', file=sys.stderr)
+        reason = get_invalid_reason(record)
+        if reason is not None:
+            print(f'CSV #{lno}: {reason}', file=sys.stderr)
             removing_keys.append(id)
-            continue
-
-        for column in record:
-            if len(column) > 0:
-                break
-        else:
-            print(f'CSV #{lno}: Empty record', file=sys.stderr)
-            removing_keys.append(id)
-            continue
 
     for id in removing_keys:
         ds['data'].pop(id)
@@ -134,11 +325,20 @@ def get_number_list(number_list_exp):
 
     return list(set(number_list))
 
+def get_byte_size(size_exp):
+
+    m = re.match('^([0-9]+(\.[0-9]+)?)\s*([KkMmGgTt]?)[Bb]?$', size_exp.strip())
+    if m is None:
+        return None
+
+    units = { '': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40 }
+    return int(float(m.group(1)) * units[m.group(3).lower()])
+
 def get_record_ids(ds, headers):
 
     record_ids = []
     if headers is None:
-        record_ids = sorted(list(ds['data'].keys()))
+        record_ids = ds['data'].keys()
     else:
         header_line_list = get_number_list(headers)
         if header_line_list is None:
@@ -194,6 +394,7 @@ def get_header_line(ds, record_id, column_numbers):
 
     line_number = str(int(lno))
     line = {
+        'id': record_id,
         'filename': ds['meta']['filename'],
         'line_number': line_number,
         'columns': [],
@@ -204,71 +405,174 @@ def get_header_line(ds, record_id, column_numbers):
         line['items'].append(f'{columnnumber2exp(cno)}:{record[cno]}')
     return line
 
-def detect(csv_paths, encoding=None, prefix=None, hint=None):
+def expand_csv_objects(csv_objects):
 
-    if csv_paths is None or len(csv_paths) == 0:
-        def analyze(line):
-            v = line.split(' ', 1)
-            if len(v) >=2:
-                return { 'name': v[0].strip(), 'path': v[1].strip() }
-            elif len(v) == 1:
-                return { 'name': None, 'path': v[0].strip() }
-            else:
-                return None
-        csv_lines = sys.stdin.readlines()
-        csv_objects = list(map(analyze, csv_lines))
-    else:
-        csv_objects = list(map(lambda x: { 'name': None, 'path': x }, csv_paths))
-
-    collection = []
     for csv_object in csv_objects:
 
-        if csv_object['path'] is None:
-            contine
+        if csv_object is None or len(csv_object['path']) == 0:
+            continue
+
+        if is_zip_path(csv_object['path']):
+            for member in list_zip_members(csv_object['path']):
+                name = f'{csv_object["name"]} {member}' if csv_object['name'] is not None else None
+                yield { 'name': name, 'path': f'{csv_object["path"]}!{member}' }
+        else:
+            yield csv_object
+
+def load_dataset(csv_object, encoding=None, prefix=None, where=None, keep=None, jobs=None, chunk_size=None, header_hint=None):
+    return create_dataset(csv_object['name'], csv_object['path'], prefix=prefix, encoding=encoding, where=where, keep=keep, clean=True, jobs=jobs, chunk_size=chunk_size, header_hint=header_hint)
 
-        ds = create_dataset(csv_object['name'], csv_object['path'], prefix=prefix, encoding=encoding)
-        ds = remove_invalid_records(ds)
+def filter_dataset(ds, where, hint=None):
 
-        collected = {
-            'dataset': ds,
-            'header': None,
-            'selection': None,
-            'status': 0
-        }
+    hint_headers, hint_values = get_hints(hint)
+    keep = get_number_list(hint_headers) if hint_headers is not None else None
+    header_pending = keep is None and hint_values is not None
+
+    data = {}
+    kept = set()
+    for id, record in ds['data'].items():
+        header = header_pending and is_header_candidate(record, hint_values)
+        if header:
+            header_pending = False
+        if where(record) or header:
+            data[id] = record
+        elif keep is not None:
+            _, lno = decode_record_id(id)
+            if int(lno) in keep:
+                data[id] = record
+                kept.add(id)
+
+    return {
+        'meta': ds['meta'],
+        'data': data,
+        'kept': kept
+    }
 
-        hint_headers, hint_values = get_hints(hint)
+def detect_header(ds, hint=None):
 
-        detected = None
-        record_ids = get_record_ids(ds, hint_headers)
-        if record_ids is None:
+    hint_headers, hint_values = get_hints(hint)
+
+    collected = {
+        'dataset': ds,
+        'header': None,
+        'selection': None,
+        'status': 0
+    }
+
+    record_ids = get_record_ids(ds, hint_headers)
+    if record_ids is None:
+        filename = ds['meta']['filename']
+        print(f'{filename}: Invalid expression in line numbers', file=sys.stderr)
+        collected['status'] = errno.EINVAL
+        return collected
+
+    for record_id in record_ids:
+        record = ds['data'].get(record_id)
+        _, line_number = decode_record_id(record_id)
+
+        if record == None:
             filename = ds['meta']['filename']
-            print(f'{filename}: Invalid expression in line numbers', file=sys.stderr)
-            collected['status'] = errno.EINVAL
-            collection.append(collected)
+            print(f'{filename}#{int(line_number)}: No such a record', file=sys.stderr)
         else:
-            for record_id in record_ids:
-                record = ds['data'].get(record_id)
-                _, line_number = decode_record_id(record_id)
-
-                if record == None:
-                    filename = ds['meta']['filename']
-                    print(f'{filename}#{int(line_number)}: No such a record', file=sys.stderr)
-                else:
-                    if hint_values is not None:
-                        header_columns = detect_header_columns(record, hint_values)
-                        if header_columns is not None:
-                            collected['header'] = get_header_line(ds, record_id, header_columns)
-                            collected['status'] = 0
-                            collection.append(collected)
-                            break
-            else:
-                if hint_values is not None:
-                    filename = ds['meta']['filename']
-                    print(f'{filename}: No records like hints', file=sys.stderr)
-                    collected['status'] = errno.EINVAL
-                collection.append(collected)
+            if hint_values is not None:
+                header_columns = detect_header_columns(record, hint_values)
+                if header_columns is not None:
+                    collected['header'] = get_header_line(ds, record_id, header_columns)
+                    collected['status'] = 0
+                    return collected
+    else:
+        if hint_values is not None:
+            filename = ds['meta']['filename']
+            print(f'{filename}: No records like hints', file=sys.stderr)
+            collected['status'] = errno.EINVAL
+
+    return collected
 
-    return collection
+def remove_kept_records(collected):
+
+    ds = collected['dataset']
+    kept = ds.pop('kept', None)
+    if kept is None or len(kept) == 0:
+        return collected
+
+    header = collected['header']
+    header_id = header['id'] if header is not None else None
+    for id in kept:
+        if id != header_id:
+            ds['data'].pop(id, None)
+
+    return collected
+
+def detect_dataset(csv_object, encoding=None, prefix=None, hint=None, where=None, jobs=None, chunk_size=None):
+
+    hint_headers, hint_values = get_hints(hint)
+    keep = None
+    header_hint = None
+    if where is not None and hint_headers is not None:
+        keep = get_number_list(hint_headers)
+    elif where is not None and hint_values is not None:
+        header_hint = hint_values
+
+    ds = load_dataset(csv_object, encoding=encoding, prefix=prefix, where=where, keep=keep, jobs=jobs, chunk_size=chunk_size, header_hint=header_hint)
+    return remove_kept_records(detect_header(ds, hint))
+
+def analyze(line):
+    v = line.strip().split(None, 1)
+    if len(v) >= 2:
+        return { 'name': v[0], 'path': v[1].strip() }
+    elif len(v) == 1:
+        return { 'name': None, 'path': v[0] }
+    else:
+        return None
+
+def iterate_csv_objects(csv_paths):
+
+    if csv_paths is None or len(csv_paths) == 0:
+        csv_objects = map(analyze, sys.stdin)
+    else:
+        csv_objects = map(lambda x: { 'name': None, 'path': x }, csv_paths)
+
+    return expand_csv_objects(csv_objects)
+
+def imap_csv_objects(function, csv_objects, jobs=None, chunk_size=None):
+
+    if chunk_size is not None:
+        function = partial(function, jobs=jobs, chunk_size=chunk_size)
+        yield from map(function, csv_objects)
+    elif jobs is not None and jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = Queue(maxsize=jobs * 4)
+            def submit():
+                try:
+                    for csv_object in csv_objects:
+                        futures.put(executor.submit(function, csv_object))
+                except Exception as e:
+                    failed = Future()
+                    failed.set_exception(e)
+                    futures.put(failed)
+                finally:
+                    futures.put(None)
+            Thread(target=submit, daemon=True).start()
+            while True:
+                future = futures.get()
+                if future is None:
+                    break
+                yield future.result()
+    else:
+        yield from map(function, csv_objects)
+
+def load_datasets(csv_paths, encoding=None, prefix=None, jobs=None, chunk_size=None):
+
+    load_one = partial(load_dataset, encoding=encoding, prefix=prefix)
+    return list(imap_csv_objects(load_one, iterate_csv_objects(csv_paths), jobs=jobs, chunk_size=chunk_size))
+
+def detect_iter(csv_paths, encoding=None, prefix=None, hint=None, where=None, jobs=None, chunk_size=None):
+
+    detect_one = partial(detect_dataset, encoding=encoding, prefix=prefix, hint=hint, where=where)
+    return imap_csv_objects(detect_one, iterate_csv_objects(csv_paths), jobs=jobs, chunk_size=chunk_size)
+
+def detect(csv_paths, encoding=None, prefix=None, hint=None, where=None, jobs=None, chunk_size=None):
+    return list(detect_iter(csv_paths, encoding=encoding, prefix=prefix, hint=hint, where=where, jobs=jobs, chunk_size=chunk_size))
 
 def get_post_process(args):
 
@@ -290,7 +594,7 @@ def main():
 
     sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8", line_buffering=True)
 
     import argparse
     from argparse import HelpFormatter
@@ -301,10 +605,12 @@ def main():
             super(SortingHelpFormatter, self).add_arguments(actions)
 
     parser = argparse.ArgumentParser(description='Open dataset utilty', formatter_class=SortingHelpFormatter)
-    parser.add_argument('path', nargs='*', metavar='CSVPATH', help='open data csv path')
+    parser.add_argument('path', nargs='*', metavar='CSVPATH', help='open data csv path, \'.gz\' file, \'.zip\' file or \'ARCHIVE.zip!MEMBER.csv\'')
     parser.add_argument('-d', '--delimiter', nargs=1, default=',', help='delimiter')
     parser.add_argument('--encoding', nargs=1, metavar='CODEPAGE', help='input encoding')
     parser.add_argument('--hint', nargs=1, metavar='HINTS', help='header record hint as \'RANGE:VALUES\',eg. \'1-5:*A,[Nn]ame\'')
+    parser.add_argument('--jobs', nargs=1, type=int, metavar='N', help='number of csv files processed in parallel')
+    parser.add_argument('--split', nargs=1, metavar='SIZE', help='parse csv larger than SIZE in parallel chunks of SIZE, eg. \'64M\'')
     parser.add_argument('--csv', action='store_true', help='csv output')
     parser.add_argument('--post-process', nargs=1, metavar='module', help='call post process module')
     parser.add_argument('--post-process-args', nargs='*', metavar='NAME=VALUE', help='post process module arguments')
@@ -318,8 +624,16 @@ def main():
     csv_path = args.path if args.path is not None else None
     encoding = args.encoding[0] if args.encoding is not None else None
     hint = args.hint[0] if args.hint is not None else None
-    
-    collection = detect(csv_path, encoding=encoding, hint=hint)
+    jobs = args.jobs[0] if args.jobs is not None else None
+
+    chunk_size = None
+    if args.split is not None:
+        chunk_size = get_byte_size(args.split[0])
+        if chunk_size is None or chunk_size == 0:
+            print(f'Invalid split size: {args.split[0]}', file=sys.stderr)
+            return errno.EINVAL
+
+    collection = detect_iter(csv_path, encoding=encoding, hint=hint, jobs=jobs, chunk_size=chunk_size)
     post_process = get_post_process(args)
     return post_process.detected(collection)
 
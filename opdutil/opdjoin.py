@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+import csv
+import errno
+import hashlib
+import heapq
+import io
+import json
+import os
+import sys
+import tempfile
+from importlib import import_module
+from itertools import chain
+from operator import itemgetter
+
+from opdutil.opddetect import columnexp2number
+from opdutil.opddetect import detect_dataset
+from opdutil.opddetect import encode_record_id
+from opdutil.opddetect import get_byte_size
+from opdutil.opddetect import get_csv_size
+from opdutil.opddetect import get_invalid_reason
+from opdutil.opddetect import iterate_csv_objects
+from opdutil.opddetect import open_csv
+from opdutil.opdselect import get_selection_index
+from opdutil.opdselect import select_iter
+from opdutil.opdselect import select_record
+from opdutil.where import compile_where
+
+MAX_PARTITION_LEVEL = 4
+SUB_PARTITIONS = 4
+
+def get_key_columns(key):
+
+    keys = key.split(':', 1)
+    left_key = columnexp2number(keys[0].strip())
+    right_key = columnexp2number(keys[1].strip()) if len(keys) == 2 else left_key
+    return left_key, right_key
+
+def get_row_size(row):
+
+    size = sys.getsizeof(row)
+    for column in row:
+        size = size + sys.getsizeof(column)
+    return size
+
+def get_row_key(row, key_index):
+    return row[key_index] if key_index < len(row) else None
+
+def get_partition(key, partitions, level=0):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8, person=bytes([level])).digest(), 'little') % partitions
+
+def no_records(record):
+    return False
+
+def detect_with_header(with_path, encoding=None, hint=None):
+
+    for csv_object in iterate_csv_objects([with_path]):
+        return detect_dataset(csv_object, encoding=encoding, hint=hint, where=no_records)
+
+    print(f'{with_path}: No such a csv', file=sys.stderr)
+    return None
+
+def iterate_with_rows(collected, encoding=None, report=True):
+
+    meta = collected['dataset']['meta']
+    header = collected['header']
+    column_numbers = header['columns'] if header is not None else None
+    with open_csv(meta['path'], encoding=encoding) as fd:
+        lno = 1
+        for record in csv.reader(fd):
+            reason = get_invalid_reason(record)
+            if reason is not None:
+                if report is True:
+                    print(f'CSV #{lno:08}: {reason}', file=sys.stderr)
+            else:
+                id = encode_record_id(meta['id'], lno)
+                record = select_record(meta['filename'], id, record, column_numbers, [])
+                if record is not None:
+                    yield [meta['id'], id] + record
+            lno = lno + 1
+
+def build_index(rows, key_index, memory_limit=None):
+
+    index = {}
+    width = 0
+    size = 0
+    raw_size = 0
+    for row in rows:
+        width = max(width, len(row) - 2)
+        key = get_row_key(row, key_index)
+        if key is None:
+            continue
+        index.setdefault(key, []).append(row)
+        if memory_limit is not None:
+            size = size + get_row_size(row)
+            raw_size = raw_size + sum(map(len, row[2:])) + len(row) - 2
+            if size > memory_limit:
+                return index, width, size / max(raw_size, 1)
+
+    return index, width, None
+
+def probe_index(index, rows, key_index, how, right_width):
+
+    for row in rows:
+        matches = index.get(get_row_key(row, key_index))
+        if matches is not None:
+            for match in matches:
+                yield row + match[2:]
+        elif how == 'left':
+            yield row + [''] * right_width
+
+def partition_rows(rows, key_index, partitions, directory, name, level=0, skip_missing=False):
+
+    paths = [os.path.join(directory, f'{name}-{n}.jsonl') for n in range(0, partitions)]
+    fds = [open(path, 'w', encoding='utf-8') for path in paths]
+    width = 0
+    try:
+        for row in rows:
+            width = max(width, len(row[-1]) - 2)
+            key = get_row_key(row[-1], key_index)
+            if key is None and skip_missing is True:
+                continue
+            n = get_partition(key, partitions, level) if key is not None else 0
+            fds[n].write(json.dumps(row, ensure_ascii=False))
+            fds[n].write('\n')
+    finally:
+        for fd in fds:
+            fd.close()
+
+    return paths, width
+
+def read_partition(path):
+
+    with open(path, encoding='utf-8') as fd:
+        for line in fd:
+            yield json.loads(line)
+
+def join_partition(build_path, build_key_index, probe_path, probe_key_index, how, right_width, memory_limit, level=0):
+
+    limit = memory_limit if level < MAX_PARTITION_LEVEL else None
+    index, _, memory_ratio = build_index(map(itemgetter(-1), read_partition(build_path)), build_key_index, limit)
+    if memory_ratio is None:
+        result = []
+        for seq, row in read_partition(probe_path):
+            for joined in probe_index(index, [row], probe_key_index, how, right_width):
+                result.append((seq, joined))
+        return result
+
+    index = None
+    name = os.path.splitext(build_path)[0]
+    build_paths, _ = partition_rows(read_partition(build_path), build_key_index, SUB_PARTITIONS, os.path.dirname(name), f'{os.path.basename(name)}.{level + 1}', level + 1)
+    probe_paths, _ = partition_rows(read_partition(probe_path), probe_key_index, SUB_PARTITIONS, os.path.dirname(name), f'{os.path.basename(name)}.{level + 1}.probe', level + 1)
+
+    results = []
+    for sub_build_path, sub_probe_path in zip(build_paths, probe_paths):
+        results.append(join_partition(sub_build_path, build_key_index, sub_probe_path, probe_key_index, how, right_width, memory_limit, level + 1))
+        os.remove(sub_build_path)
+        os.remove(sub_probe_path)
+
+    return list(heapq.merge(*results, key=itemgetter(0)))
+
+def join_partitions(build_paths, build_key_index, probe, probe_key_index, how, right_width, memory_limit, directory):
+
+    probe_paths, _ = partition_rows(enumerate(probe), probe_key_index, len(build_paths), directory, 'probe')
+
+    results = []
+    for build_path, probe_path in zip(build_paths, probe_paths):
+        results.append(join_partition(build_path, build_key_index, probe_path, probe_key_index, how, right_width, memory_limit))
+        os.remove(probe_path)
+
+    return [joined for _, joined in heapq.merge(*results, key=itemgetter(0))]
+
+def join_indexed_selection(selection, key_index, right_rows, right_key_index):
+
+    index = {}
+    for n, row in enumerate(selection):
+        key = get_row_key(row, key_index)
+        if key is not None:
+            index.setdefault(key, []).append(n)
+
+    matches = {}
+    for right_row in right_rows:
+        for n in index.get(get_row_key(right_row, right_key_index), []):
+            matches.setdefault(n, []).append(right_row[2:])
+
+    joined = []
+    for n, row in enumerate(selection):
+        for match in matches.get(n, []):
+            joined.append(row + match)
+
+    return joined
+
+def join(csv_paths, with_path, left_key, right_key, how='inner', memory_limit=None, prefix=None, encoding=None, hint=None, with_hint=None, where=None):
+
+    right_collected = detect_with_header(with_path, encoding=encoding, hint=with_hint)
+    status = right_collected['status'] if right_collected is not None else errno.ENOENT
+
+    right_key_index = None
+    if status == 0:
+        right_key_index = get_selection_index(right_collected, right_key)
+        if right_key_index is None:
+            filename = right_collected['dataset']['meta']['filename']
+            print(f'{filename}: Join key column is not selected', file=sys.stderr)
+            status = errno.EINVAL
+
+    if status != 0:
+        for collected in select_iter(csv_paths, prefix=prefix, encoding=encoding, hint=hint, where=where):
+            collected['selection'] = None
+            collected['status'] = status
+            yield collected
+        return
+
+    right_path = right_collected['dataset']['meta']['path']
+    right_size = get_csv_size(right_path)
+
+    with tempfile.TemporaryDirectory(prefix='opdjoin-') as directory:
+        index = None
+        build_paths = None
+        right_width = None
+        reported = False
+
+        def iterate_right():
+            nonlocal reported
+            report = not reported
+            reported = True
+            return iterate_with_rows(right_collected, encoding=encoding, report=report)
+
+        def build_right():
+            nonlocal index, build_paths, right_width
+            right = iterate_right()
+            index, right_width, memory_ratio = build_index(right, right_key_index, memory_limit)
+            if memory_ratio is not None:
+                partitions = int(memory_ratio * right_size / memory_limit) * 2 + 2
+                rows = chain(chain.from_iterable(index.values()), right)
+                index = None
+                build_paths, width = partition_rows(map(lambda x: [x], rows), right_key_index, partitions, directory, 'build', skip_missing=True)
+                right_width = max(right_width, width)
+            if right_collected['header'] is not None:
+                right_width = len(right_collected['header']['columns'])
+
+        for collected in select_iter(csv_paths, prefix=prefix, encoding=encoding, hint=hint, where=where, release=memory_limit is not None):
+            if collected['status'] != 0:
+                yield collected
+                continue
+
+            left_key_index = get_selection_index(collected, left_key)
+            if left_key_index is None:
+                filename = collected['dataset']['meta']['filename']
+                print(f'{filename}: Join key column is not selected', file=sys.stderr)
+                collected['selection'] = None
+                collected['status'] = errno.EINVAL
+            elif how == 'inner' and get_csv_size(collected['dataset']['meta']['path']) < right_size:
+                right = iterate_right()
+                collected['selection'] = join_indexed_selection(collected['selection'], left_key_index, right, right_key_index)
+            else:
+                if right_width is None:
+                    build_right()
+                if build_paths is None:
+                    collected['selection'] = list(probe_index(index, collected['selection'], left_key_index, how, right_width))
+                else:
+                    collected['selection'] = join_partitions(build_paths, right_key_index, collected['selection'], left_key_index, how, right_width, memory_limit, directory)
+            yield collected
+
+def get_post_process(args):
+
+    if __package__ is None:
+        package = ''
+    else:
+        package = f'{__package__}'
+
+    if args.post_process is not None:
+        name = args.post_process[0]
+    else:
+        name = 'print'
+
+    module = import_module(f'.o_{name}', f'{package}.modules')
+    post_process = module.PostProcess(args)
+    return post_process
+
+def main():
+
+    sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8", line_buffering=True)
+
+    import argparse
+    from argparse import HelpFormatter
+    from operator import attrgetter
+    class SortingHelpFormatter(HelpFormatter):
+        def add_arguments(self, actions):
+            actions = sorted(actions, key=attrgetter('option_strings'))
+            super(SortingHelpFormatter, self).add_arguments(actions)
+
+    parser = argparse.ArgumentParser(description='Open dataset utilty', formatter_class=SortingHelpFormatter)
+    parser.add_argument('path', nargs='*', metavar='CSVPATH', help='open data csv path')
+    parser.add_argument('-d', '--delimiter', nargs=1, default=',', help='delimiter')
+    parser.add_argument('--encoding', nargs=1, metavar='CODEPAGE', help='input encoding')
+    parser.add_argument('--prefix', nargs=1, metavar='NAME', help='record id prefix')
+    parser.add_argument('--hint', nargs=1, metavar='HINTS', help='header record hint as \'RANGE:VALUES\', eg. \'1-5:*A,[Nn]ame\'')
+    parser.add_argument('--where', nargs=1, metavar='EXPRESSION', help='row condition on columns, eg. \'B ~ "^Tokyo" and C in 10..20 and D in (x, y)\'')
+    parser.add_argument('--with', nargs=1, required=True, dest='with_path', metavar='CSVPATH', help='csv path joined to each dataset')
+    parser.add_argument('--with-hint', nargs=1, metavar='HINTS', help='header record hint of joined csv')
+    parser.add_argument('--key', nargs=1, required=True, metavar='COLUMNS', help='join key column as \'COLUMN\' or \'COLUMN:WITH_COLUMN\', eg. \'A:C\'')
+    parser.add_argument('--left', action='store_true', help='left outer join')
+    parser.add_argument('--memory-limit', nargs=1, metavar='SIZE', help='hash index size to spill to disk, eg. \'512M\'')
+    parser.add_argument('--csv', action='store_true', help='csv output')
+    parser.add_argument('--post-process', nargs=1, metavar='module', help='call post process module')
+    parser.add_argument('--post-process-args', nargs='*', metavar='NAME=VALUE', help='post process module arguments')
+
+    if len(sys.argv) == 1:
+        print(parser.format_usage(), file=sys.stderr)
+        exit(1)
+
+    args = parser.parse_args()
+
+    csv_path = args.path if args.path is not None else None
+    encoding = args.encoding[0] if args.encoding is not None else None
+    prefix = args.prefix[0] if args.prefix is not None else None
+    hint = args.hint[0] if args.hint is not None else None
+    with_hint = args.with_hint[0] if args.with_hint is not None else None
+    how = 'left' if args.left is True else 'inner'
+
+    left_key, right_key = get_key_columns(args.key[0])
+    if left_key is None or right_key is None:
+        print(f'Invalid join key: {args.key[0]}', file=sys.stderr)
+        return errno.EINVAL
+
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = get_byte_size(args.memory_limit[0])
+        if memory_limit is None:
+            print(f'Invalid memory limit: {args.memory_limit[0]}', file=sys.stderr)
+            return errno.EINVAL
+
+    where = None
+    if args.where is not None:
+        try:
+            where = compile_where(args.where[0])
+        except ValueError as e:
+            print(f'Invalid where expression: {e}', file=sys.stderr)
+            return errno.EINVAL
+
+    collection = join(csv_path, args.with_path[0], left_key, right_key, how=how, memory_limit=memory_limit, prefix=prefix, encoding=encoding, hint=hint, with_hint=with_hint, where=where)
+    post_process = get_post_process(args)
+    return post_process.selected(collection)
+
+if __name__ == '__main__':
+    exit(main())
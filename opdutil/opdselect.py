@@ -1,17 +1,38 @@
 #!/usr/bin/env python3
 
+import copy
 import csv
 import errno
 import io
 import json
+import math
 import os
+import pickle
 import re
 import sys
+import tempfile
+from array import array
+from collections import deque
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from importlib import import_module
+from itertools import compress
 from itertools import zip_longest
+from threading import Condition
+from threading import Thread
 
-from opdutil.opddetect import detect
+from opdutil.geo import GridIndex
+from opdutil.geo import get_region
+from opdutil.opddetect import columnexp2number
+from opdutil.opddetect import detect_iter
+from opdutil.opddetect import detect_header
+from opdutil.opddetect import encode_record_id
+from opdutil.opddetect import filter_dataset
+from opdutil.opddetect import get_byte_size
+from opdutil.opddetect import load_datasets
+from opdutil.opddetect import remove_kept_records
+from opdutil.where import compile_where
 
 def columnnumber2exp(n):
     if n >= 26:
@@ -21,70 +42,530 @@ def columnnumber2exp(n):
     else:
         return None
 
+COLUMN_TYPECODES = {
+    'int': 'q',
+    'float': 'd',
+    'geo:lat': 'd',
+    'geo:lon': 'd'
+}
+
+COLUMN_RANGES = {
+    'geo:lat': (-90.0, 90.0),
+    'geo:lon': (-180.0, 180.0)
+}
+
+def get_column_filter(column_filter_list):
+
+    column_filter = []
+    if column_filter_list is not None:
+        for ctype in column_filter_list.split(','):
+            if ctype == 'geo:point':
+                column_filter.extend(['geo:lat', 'geo:lon'])
+            else:
+                column_filter.append(ctype)
+
+    return column_filter
+
+def convert_column(cells, ctype):
+
+    typecode = COLUMN_TYPECODES[ctype]
+    convert = int if typecode == 'q' else float
+    try:
+        values = array(typecode, map(convert, cells))
+        mask = bytearray(b'\x01') * len(cells)
+    except (ValueError, TypeError, OverflowError):
+        values = array(typecode)
+        mask = bytearray(len(cells))
+        for n, cell in enumerate(cells):
+            try:
+                values.append(convert(cell))
+                mask[n] = 1
+            except (ValueError, TypeError, OverflowError):
+                values.append(math.nan if typecode == 'd' else 0)
+
+    if ctype in COLUMN_RANGES:
+        low, high = COLUMN_RANGES[ctype]
+        if len(values) > 0 and (min(values) < low or max(values) > high or any(map(math.isnan, values))):
+            for n, value in enumerate(values):
+                if math.isnan(value) or value < low or value > high:
+                    mask[n] = 0
+
+    return values, mask
+
+def select_columns_typed(ds_old, column_numbers, column_filter_list, strict=False, header_id=None):
+
+    column_filter = get_column_filter(column_filter_list)
+
+    ids = list(ds_old['data'].keys())
+    records = list(ds_old['data'].values())
+    ragged = column_numbers is None
+    if ragged:
+        column_numbers = range(0, max(map(len, records), default=0))
+    header_position = ids.index(header_id) if header_id in ds_old['data'] else None
+
+    mask = bytearray(b'\x01') * len(records)
+    reasons = [None] * len(records)
+
+    def invalidate(n, reason):
+        if mask[n] == 1:
+            mask[n] = 0
+            reasons[n] = reason
+
+    typed_columns = []
+    for cno, ctype in zip_longest(column_numbers, column_filter):
+        if cno is None:
+            continue
+        if ctype == '':
+            ctype = None
+
+        cells = [record[cno] if cno < len(record) else None for record in records]
+        for n, cell in enumerate(cells):
+            if cell is None:
+                if not ragged:
+                    invalidate(n, f'No such a column {columnnumber2exp(cno)}')
+            elif strict is True and len(cell) == 0:
+                invalidate(n, f'No content in column {columnnumber2exp(cno)}')
+
+        if ctype in COLUMN_TYPECODES:
+            if header_position is None:
+                values, column_mask = convert_column(cells, ctype)
+            else:
+                values, column_mask = convert_column(cells[:header_position] + cells[header_position + 1:], ctype)
+                header_values, header_mask = convert_column([cells[header_position]], ctype)
+                values.insert(header_position, header_values[0])
+                column_mask.insert(header_position, header_mask[0])
+            for n in range(0, len(records)):
+                if column_mask[n] == 0 and cells[n] is not None:
+                    invalidate(n, f'Unmatched type of column {columnnumber2exp(cno)}')
+            typed_columns.append(values)
+        else:
+            typed_columns.append(None)
+
+    filename = ds_old['meta']['filename']
+    for id, reason in zip(ids, reasons):
+        if reason is not None:
+            lno = id.split('-')[1]
+            print(f'{filename}#{lno}: {reason}', file=sys.stderr)
+
+    ds = {}
+    ds['meta'] = ds_old['meta']
+    ds['data'] = {}
+    for id, record in compress(zip(ids, records), mask):
+        ds['data'][id] = record if ragged else [record[cno] for cno in column_numbers]
+    ds['columns'] = []
+    for values in typed_columns:
+        if values is not None:
+            values = array(values.typecode, compress(values, mask))
+        ds['columns'].append(values)
+    ds['mask'] = mask
+
+    return ds
+
+def select_record(filename, id, record_old, column_numbers, column_filter, strict=False):
+
+    len_old = len(record_old)
+    lno = id.split('-')[1]
+    record = []
+    record_column_numbers = column_numbers if column_numbers is not None else range(0, len_old)
+    for cno, ctype in zip_longest(record_column_numbers, column_filter):
+        if cno is None:
+            continue
+        if ctype == '':
+            ctype = None
+
+        if cno >= len_old:
+            print(f'{filename}#{lno}: No such a column {columnnumber2exp(cno)}', file=sys.stderr)
+            return None
+        elif strict is True and len(record_old[cno]) == 0:
+            print(f'{filename}#{lno}: No content in column {columnnumber2exp(cno)}', file=sys.stderr)
+            return None
+        elif ctype is not None:
+            try:
+                if ctype == 'int' and int(record_old[cno]):
+                    pass
+                elif ctype == 'float' and float(record_old[cno]):
+                    pass
+                elif ctype in COLUMN_RANGES:
+                    low, high = COLUMN_RANGES[ctype]
+                    if not low <= float(record_old[cno]) <= high:
+                        raise ValueError
+            except ValueError:
+                print(f'{filename}#{lno}: Unmatched type of column {columnnumber2exp(cno)}', file=sys.stderr)
+                return None
+        record.append(record_old[cno])
+
+    return record
+
 def select_columns(ds_old, column_numbers, column_filter_list, strict=False):
 
-    if column_filter_list is None:
-        column_filter = []
-    else:
-        column_filter = column_filter_list.split(',')
+    column_filter = get_column_filter(column_filter_list)
+    filename = ds_old['meta']['filename']
 
     ds = {}
     ds['meta'] = ds_old['meta']
     ds['data'] = {}
     for id, record_old in ds_old['data'].items():
-        len_old = len(record_old)
-        lno = id.split('-')[1]
-        record = []
-        record_column_numbers = column_numbers if column_numbers is not None else range(0, len_old)
-        for cno, ctype in zip_longest(record_column_numbers, column_filter):
-            if cno is None:
-                continue
-            if ctype == '':
-                ctype = None
-
-            if cno > len_old:
-                filename = ds_old['meta']['filename']
-                print(f'{filename}#{lno}: No such a column {columnnumber2exp(cno)}', file=sys.stderr)
-                break
-            elif strict is True and len(record_old[cno]) == 0:
-                filename = ds_old['meta']['filename']
-                print(f'{filename}#{lno}: No content in column {columnnumber2exp(cno)}', file=sys.stderr)
+        record = select_record(filename, id, record_old, column_numbers, column_filter, strict)
+        if record is not None:
+            ds['data'][id] = record
+
+    return ds
+
+def get_selection_index(collected, cno):
+
+    header = collected['header']
+    if header is None:
+        return cno + 2
+    elif cno in header['columns']:
+        return header['columns'].index(cno) + 2
+    else:
+        return None
+
+def get_geo_indexes(collected, geo_columns=None, column_filter_list=None):
+
+    if geo_columns is not None:
+        lat_index = get_selection_index(collected, geo_columns[0])
+        lon_index = get_selection_index(collected, geo_columns[1])
+        if lat_index is None or lon_index is None:
+            return None
+        return lat_index, lon_index
+
+    column_filter = get_column_filter(column_filter_list)
+    if 'geo:lat' in column_filter:
+        k = column_filter.index('geo:lat')
+        return k + 2, k + 3
+    else:
+        return None
+
+def select_regions(collected, regions, geo_columns=None, filter=None):
+
+    if collected['status'] != 0 or collected['selection'] is None:
+        yield collected
+        return
+
+    indexes = get_geo_indexes(collected, geo_columns, filter)
+    if indexes is None:
+        filename = collected['dataset']['meta']['filename']
+        print(f'{filename}: No geo:point columns', file=sys.stderr)
+        collected['selection'] = None
+        collected['status'] = errno.EINVAL
+        yield collected
+        return
+
+    selection = collected['selection']
+    typed_columns = collected.get('columns')
+    coordinates = []
+    for index in indexes:
+        if typed_columns is not None and index - 2 < len(typed_columns) and typed_columns[index - 2] is not None:
+            coordinates.append(typed_columns[index - 2])
+        else:
+            coordinates.append([vector[index] if index < len(vector) else None for vector in selection])
+    grid = GridIndex(*coordinates)
+
+    meta = collected['dataset']['meta']
+    header_position = None
+    header = collected['header']
+    if header is not None:
+        header_id = header['id']
+        for n, vector in enumerate(selection):
+            if vector[1] == header_id:
+                header_position = n
                 break
-            elif ctype is not None:
-                try:
-                    if ctype == 'int' and int(record_old[cno]):
-                        pass
-                    elif ctype == 'float' and float(record_old[cno]):
-                        pass
-                except ValueError:
-                    filename = ds_old['meta']['filename']
-                    print(f'{filename}#{lno}: Unmatched type of column {columnnumber2exp(cno)}', file=sys.stderr)
+
+    for region_number, region in enumerate(regions, 1):
+        numbers = grid.query(region)
+        if header_position is not None and header_position not in numbers:
+            numbers = sorted(numbers + [header_position])
+
+        region_meta = dict(meta)
+        region_meta['id'] = f'{meta["id"]}_{region["kind"]}{region_number}'
+        region_meta['name'] = f'{meta["name"]} {region["kind"]}{region_number}'
+
+        region_collected = dict(collected)
+        region_collected['dataset'] = { 'meta': region_meta, 'data': {} }
+        region_collected['region'] = region['label']
+        region_collected['selection'] = [[region_meta['id']] + selection[n][1:] for n in numbers]
+        if typed_columns is not None:
+            region_collected['columns'] = [array(values.typecode, (values[n] for n in numbers)) if values is not None else None for values in typed_columns]
+        yield region_collected
+
+def select_collected(collected, filter=None, strict=False, typed=False, release=False):
+
+    if collected['status'] == 0:
+        ds = collected['dataset']
+        header = collected['header']
+        column_numbers = header['columns'] if header is not None else None
+        if typed is True:
+            header_id = header['id'] if header is not None else None
+            ds = select_columns_typed(ds, column_numbers, filter, strict, header_id)
+            collected['columns'] = ds['columns']
+            collected['mask'] = ds['mask']
+        else:
+            ds = select_columns(ds, column_numbers, filter, strict)
+
+        if release is True:
+            collected['dataset'] = { 'meta': ds['meta'], 'data': {} }
+
+        selecteds = []
+        data = ds['data']
+        while len(data) > 0:
+            id, record = data.popitem()
+            selecteds.append([ds['meta']['id'], id] + record)
+        selecteds.reverse()
+
+        collected['selection'] = selecteds
+
+    return collected
+
+def get_selection_size(collected, samples=100):
+
+    size = 0
+    for values in collected.get('columns') or []:
+        if values is not None:
+            size = size + sys.getsizeof(values)
+    if collected.get('mask') is not None:
+        size = size + sys.getsizeof(collected['mask'])
+
+    selection = collected['selection']
+    if selection is None or len(selection) == 0:
+        return size
+
+    step = max(1, len(selection) // samples)
+    sampled = selection[::step]
+    sampled_size = 0
+    for vector in sampled:
+        sampled_size = sampled_size + sys.getsizeof(vector)
+        for column in vector:
+            sampled_size = sampled_size + sys.getsizeof(column)
+
+    return size + sys.getsizeof(selection) + sampled_size * len(selection) // len(sampled)
+
+def get_peak_rss():
+
+    try:
+        import resource
+    except ImportError:
+        return None, None
+
+    scale = 1 if sys.platform == 'darwin' else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return self_rss, children_rss
+
+class SpilledCollection():
+
+    def __init__(self, collection, memory_limit):
+        self.collection = collection
+        self.memory_limit = memory_limit
+        self.directory = tempfile.TemporaryDirectory(prefix='opdselect-')
+        self.condition = Condition()
+        self.waiting = deque()
+        self.size = 0
+        self.count = 0
+        self.spilled = 0
+        self.done = False
+        self.closed = False
+        self.error = None
+
+    def produce(self):
+
+        try:
+            for collected in self.collection:
+                if self.closed is True:
+                    break
+                self.append(collected)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify()
+
+    def append(self, collected):
+
+        size = get_selection_size(collected)
+        with self.condition:
+            entry = { 'collected': collected, 'size': size, 'path': None }
+            self.waiting.append(entry)
+            self.size = self.size + size
+            self.count = self.count + 1
+
+            while self.size > self.memory_limit and self.closed is False:
+                resident = [entry for entry in self.waiting if entry['path'] is None and entry['size'] > 0]
+                if len(resident) == 0:
                     break
-            record.append(record_old[cno])
+                self.spill(max(resident, key=lambda x: x['size']))
+
+            self.condition.notify()
+
+    def spill(self, entry):
+
+        collected = entry['collected']
+        path = os.path.join(self.directory.name, f'{self.count}-{self.spilled}.pickle')
+        with open(path, 'wb') as fd:
+            pickle.dump((collected['selection'], collected.get('columns'), collected.get('mask')), fd, protocol=pickle.HIGHEST_PROTOCOL)
+
+        collected['selection'] = None
+        for name in ['columns', 'mask']:
+            if name in collected:
+                collected[name] = None
+        entry['path'] = path
+        self.size = self.size - entry['size']
+        self.spilled = self.spilled + 1
+
+    def load(self, entry):
+
+        if entry['path'] is None:
+            return entry['collected']
+
+        with open(entry['path'], 'rb') as fd:
+            selection, columns, mask = pickle.load(fd)
+        os.remove(entry['path'])
+
+        collected = entry['collected']
+        collected['selection'] = selection
+        if columns is not None:
+            collected['columns'] = columns
+        if mask is not None:
+            collected['mask'] = mask
+        return collected
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+
+        Thread(target=self.produce, daemon=True).start()
+        while True:
+            with self.condition:
+                while len(self.waiting) == 0 and self.done is False:
+                    self.condition.wait()
+                if len(self.waiting) == 0:
+                    break
+                entry = self.waiting.popleft()
+                if entry['path'] is None:
+                    self.size = self.size - entry['size']
+            yield self.load(entry)
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+        self.directory.cleanup()
+
+def select_iter(csv, prefix=None, encoding=None, hint=None, filter=None, strict=False, where=None, jobs=None, typed=False, chunk_size=None, regions=None, geo_columns=None, release=False):
+
+    for collected in detect_iter(csv, encoding, prefix=prefix, hint=hint, where=where, jobs=jobs, chunk_size=chunk_size):
+        collected = select_collected(collected, filter, strict, typed, release)
+        if regions is not None and len(regions) > 0:
+            yield from select_regions(collected, regions, geo_columns, filter)
         else:
-            ds['data'].update({id: record})
-            continue
+            yield collected
 
-    return ds
+def select(csv, prefix=None, encoding=None, hint=None, filter=None, strict=False, where=None, jobs=None, typed=False, chunk_size=None, regions=None, geo_columns=None):
+    return list(select_iter(csv, prefix=prefix, encoding=encoding, hint=hint, filter=filter, strict=strict, where=where, jobs=jobs, typed=typed, chunk_size=chunk_size, regions=regions, geo_columns=geo_columns))
 
-def select(csv, prefix=None, encoding=None, hint=None, filter=None, strict=False):
+def get_manifest_job_args(args, job):
 
-    collection = detect(csv, encoding, prefix=prefix, hint=hint)
-    for collected in collection:
-        if collected['status'] == 0:
-            ds = collected['dataset']
-            header = collected['header']
-            column_numbers = header['columns'] if header is not None else None
-            ds = select_columns(ds, column_numbers, filter, strict)
+    job_args = copy.copy(args)
+    job_args.post_process = [job['post_process']] if job.get('post_process') is not None else None
+    job_args.post_process_args = job.get('post_process_args')
+    if job.get('csv') is not None:
+        job_args.csv = job['csv']
+    if job.get('delimiter') is not None:
+        job_args.delimiter = [job['delimiter']]
+
+    return job_args
+
+def select_manifest_job(datasets, job):
 
-            selecteds = []
-            for id, record in ds['data'].items():
-                selecteds.append([ds['meta']['id'], id] + record)
+    hint = job.get('hint')
+    where = compile_where(job['where']) if job.get('where') is not None else None
 
-            collected['selection'] = selecteds
+    collection = []
+    for ds in datasets:
+        if where is not None:
+            ds = filter_dataset(ds, where, hint)
+        collected = remove_kept_records(detect_header(ds, hint))
+        collection.append(select_collected(collected, job.get('filter'), job.get('strict', False), job.get('typed', False)))
 
     return collection
 
+MANIFEST_TYPES = {
+    'path': (str, list),
+    'parallel': bool
+}
+
+MANIFEST_JOB_TYPES = {
+    'hint': str,
+    'where': str,
+    'filter': str,
+    'strict': bool,
+    'typed': bool,
+    'post_process': str,
+    'post_process_args': list,
+    'csv': bool,
+    'delimiter': str
+}
+
+def check_types(object, types, name):
+
+    for key, value_type in types.items():
+        if object.get(key) is not None and not isinstance(object[key], value_type):
+            raise ValueError(f'Invalid type of {name}{key}')
+
+def validate_manifest(manifest):
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs', []), list):
+        raise ValueError('Manifest is not an object with a jobs list')
+    check_types(manifest, MANIFEST_TYPES, '')
+    if isinstance(manifest.get('path'), list) and not all(map(lambda x: isinstance(x, str), manifest['path'])):
+        raise ValueError('Invalid type of path')
+
+    for n, job in enumerate(manifest.get('jobs', []), 1):
+        if not isinstance(job, dict):
+            raise ValueError(f'Job #{n} is not an object')
+        check_types(job, MANIFEST_JOB_TYPES, f'job #{n} ')
+        if not all(map(lambda x: isinstance(x, str), job.get('post_process_args') or [])):
+            raise ValueError(f'Invalid type of job #{n} post_process_args')
+        if job.get('where') is not None:
+            try:
+                compile_where(job['where'])
+            except ValueError as e:
+                raise ValueError(f'Invalid where expression in job #{n}: {e}')
+        if job.get('post_process') is not None:
+            try:
+                import_module(f'.o_{job["post_process"]}', f'{__package__ if __package__ is not None else ""}.modules')
+            except ImportError:
+                raise ValueError(f'No such a post process module in job #{n}: {job["post_process"]}')
+
+def select_manifest(csv, manifest, args, prefix=None, encoding=None, jobs=None, chunk_size=None):
+
+    manifest_jobs = manifest.get('jobs', [])
+    if csv is None or len(csv) == 0:
+        csv = manifest.get('path')
+        if isinstance(csv, str):
+            csv = [csv]
+    datasets = load_datasets(csv, encoding=encoding, prefix=prefix, jobs=jobs, chunk_size=chunk_size)
+
+    def post_process_all(collections):
+        ret = 0
+        for job, collection in zip(manifest_jobs, collections):
+            post_process = get_post_process(get_manifest_job_args(args, job))
+            job_ret = post_process.selected(collection)
+            if ret == 0 and job_ret is not None:
+                ret = job_ret
+        return ret
+
+    select_one = partial(select_manifest_job, datasets)
+    if manifest.get('parallel') is True and len(manifest_jobs) > 1:
+        with ThreadPoolExecutor(max_workers=len(manifest_jobs)) as executor:
+            return post_process_all(executor.map(select_one, manifest_jobs))
+    else:
+        return post_process_all(map(select_one, manifest_jobs))
+
 def get_post_process(args):
 
     if __package__ is None:
@@ -105,7 +586,7 @@ def main():
 
     sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8", line_buffering=True)
 
     import argparse
     from argparse import HelpFormatter
@@ -116,12 +597,21 @@ def main():
             super(SortingHelpFormatter, self).add_arguments(actions)
 
     parser = argparse.ArgumentParser(description='Open dataset utilty', formatter_class=SortingHelpFormatter)
-    parser.add_argument('path', nargs='*', metavar='CSVPATH', help='open data csv path')
+    parser.add_argument('path', nargs='*', metavar='CSVPATH', help='open data csv path, \'.gz\' file, \'.zip\' file or \'ARCHIVE.zip!MEMBER.csv\'')
     parser.add_argument('-d', '--delimiter', nargs=1, default=',', help='delimiter')
     parser.add_argument('--encoding', nargs=1, metavar='CODEPAGE', help='input encoding')
     parser.add_argument('--prefix', nargs=1, metavar='NAME', help='record id prefix')
     parser.add_argument('--hint', nargs=1, metavar='HINTS', help='header record hint as \'RANGE:VALUES\', eg. \'1-5:*A,[Nn]ame\'')
-    parser.add_argument('--filter', nargs=1, metavar='FILTER', help='column filter (\'int\' or \'float\')')
+    parser.add_argument('--filter', nargs=1, metavar='FILTER', help='column filter (\'int\', \'float\' or \'geo:point\' for two columns)')
+    parser.add_argument('--bbox', action='append', dest='regions', type=lambda x: ('bbox', x), metavar='S,W,N,E', help='export records in bounding box of latitude and longitude (repeatable)')
+    parser.add_argument('--radius', action='append', dest='regions', type=lambda x: ('radius', x), metavar='LAT,LON,KM', help='export records within KM of point (repeatable)')
+    parser.add_argument('--geo', nargs=1, metavar='COLUMNS', help='latitude and longitude columns as \'LAT,LON\', eg. \'E,F\' (default: geo:point in filter)')
+    parser.add_argument('--jobs', nargs=1, type=int, metavar='N', help='number of csv files processed in parallel')
+    parser.add_argument('--split', nargs=1, metavar='SIZE', help='parse csv larger than SIZE in parallel chunks of SIZE, eg. \'64M\'')
+    parser.add_argument('--where', nargs=1, metavar='EXPRESSION', help='row condition on columns, eg. \'B ~ "^Tokyo" and C in 10..20 and D in (x, y)\'')
+    parser.add_argument('--typed', action='store_true', help='build typed column arrays of filtered columns')
+    parser.add_argument('--memory-limit', nargs=1, metavar='SIZE', help='spill selections to temporary files beyond SIZE, eg. \'8G\'')
+    parser.add_argument('--manifest', nargs=1, metavar='JSONPATH', help='run selection jobs listed in json manifest over csv parsed once')
     parser.add_argument('--strict', action='store_true', help='not allow no content columns')
     parser.add_argument('--csv', action='store_true', help='csv output')
     parser.add_argument('--post-process', nargs=1, metavar='module', help='call post process module')
@@ -139,9 +629,82 @@ def main():
     hint = args.hint[0] if args.hint is not None else None
     filter = args.filter[0] if args.filter is not None else None
     strict = args.strict
-    collection = select(csv_path, prefix=prefix, encoding=encoding, hint=hint, filter=filter, strict=strict)
+    jobs = args.jobs[0] if args.jobs is not None else None
+    typed = args.typed
+
+    chunk_size = None
+    if args.split is not None:
+        chunk_size = get_byte_size(args.split[0])
+        if chunk_size is None or chunk_size == 0:
+            print(f'Invalid split size: {args.split[0]}', file=sys.stderr)
+            return errno.EINVAL
+
+    where = None
+    if args.where is not None:
+        try:
+            where = compile_where(args.where[0])
+        except ValueError as e:
+            print(f'Invalid where expression: {e}', file=sys.stderr)
+            return errno.EINVAL
+
+    regions = []
+    for kind, region_exp in args.regions if args.regions is not None else []:
+        region = get_region(kind, region_exp)
+        if region is None:
+            print(f'Invalid {kind}: {region_exp}', file=sys.stderr)
+            return errno.EINVAL
+        regions.append(region)
+
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = get_byte_size(args.memory_limit[0])
+        if memory_limit is None:
+            print(f'Invalid memory limit: {args.memory_limit[0]}', file=sys.stderr)
+            return errno.EINVAL
+
+    geo_columns = None
+    if args.geo is not None:
+        geo_columns = list(map(lambda x: columnexp2number(x.strip()), args.geo[0].split(',')))
+        if len(geo_columns) != 2 or None in geo_columns:
+            print(f'Invalid geo columns: {args.geo[0]}', file=sys.stderr)
+            return errno.EINVAL
+
+    if args.manifest is not None:
+        ignored = [option for option, value in [
+            ('--hint', hint), ('--where', args.where), ('--filter', filter), ('--strict', strict), ('--typed', typed),
+            ('--bbox/--radius', args.regions), ('--geo', args.geo), ('--memory-limit', args.memory_limit),
+            ('--post-process', args.post_process), ('--post-process-args', args.post_process_args)
+        ] if value is not None and value is not False]
+        if len(ignored) > 0:
+            print(f'Not allowed with --manifest: {", ".join(ignored)}', file=sys.stderr)
+            return errno.EINVAL
+        try:
+            with open(args.manifest[0], encoding='utf-8') as fd:
+                manifest = json.load(fd)
+            validate_manifest(manifest)
+        except (OSError, ValueError) as e:
+            print(f'Invalid manifest: {e}', file=sys.stderr)
+            return errno.EINVAL
+        return select_manifest(csv_path, manifest, args, prefix=prefix, encoding=encoding, jobs=jobs, chunk_size=chunk_size)
+
+    collection = select_iter(csv_path, prefix=prefix, encoding=encoding, hint=hint, filter=filter, strict=strict, where=where, jobs=jobs, typed=typed, chunk_size=chunk_size, regions=regions, geo_columns=geo_columns, release=memory_limit is not None)
     post_process = get_post_process(args)
-    return post_process.selected(collection)
+    if memory_limit is None:
+        return post_process.selected(collection)
+
+    collection = SpilledCollection(collection, memory_limit)
+    try:
+        ret = post_process.selected(collection)
+    finally:
+        collection.close()
+
+    self_rss, children_rss = get_peak_rss()
+    if self_rss is not None:
+        workers = (jobs is not None and jobs > 1) or chunk_size is not None
+        workers_rss = f' (workers: {children_rss // (1 << 20)}MiB)' if workers is True else ''
+        print(f'Peak RSS: {self_rss // (1 << 20)}MiB{workers_rss}, spilled {collection.spilled}/{len(collection)} selections', file=sys.stderr)
+
+    return ret
 
 if __name__ == '__main__':
     exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+import operator
+import re
+
+from opdutil.opddetect import columnexp2number
+
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<quoted>'(?:[^']|'')*'|"(?:[^"]|"")*")
+        |(?P<op>==|!=|<=|>=|!~|\.\.|[=<>~(),])
+        |(?P<word>(?:[^\s(),'"=!<>~.]|\.(?!\.))+)
+    )''', re.VERBOSE)
+
+COMPARISON_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+def tokenize(exp):
+
+    tokens = []
+    pos = 0
+    exp = exp.rstrip()
+    while pos < len(exp):
+        m = TOKEN_PATTERN.match(exp, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f'Unexpected character at {pos + 1}: {exp[pos:].strip()}')
+        pos = m.end()
+        if m.group('quoted') is not None:
+            q = m.group('quoted')
+            tokens.append(('literal', q[1:-1].replace(q[0] * 2, q[0])))
+        elif m.group('op') is not None:
+            tokens.append(('op', m.group('op')))
+        else:
+            word = m.group('word')
+            if word.lower() in ['and', 'or', 'not', 'in']:
+                tokens.append(('keyword', word.lower()))
+            else:
+                tokens.append(('word', word))
+
+    return tokens
+
+def to_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def compile_comparison(cno, op, literal):
+
+    compare = COMPARISON_OPERATORS[op]
+    literal, number = literal
+    if number is not None:
+        def predicate(record):
+            try:
+                return compare(float(record[cno]), number)
+            except (IndexError, ValueError):
+                return False
+    else:
+        def predicate(record):
+            if cno < len(record):
+                return compare(record[cno], literal)
+            else:
+                return False
+
+    return predicate
+
+def compile_regex(cno, pattern, negative):
+
+    pattern, _ = pattern
+    search = re.compile(pattern).search
+    def predicate(record):
+        if cno < len(record):
+            return (search(record[cno]) is None) is negative
+        else:
+            return False
+
+    return predicate
+
+def compile_range(cno, low, high):
+
+    low, low_number = low
+    high, high_number = high
+    if low_number is not None and high_number is not None:
+        def predicate(record):
+            try:
+                return low_number <= float(record[cno]) <= high_number
+            except (IndexError, ValueError):
+                return False
+    else:
+        def predicate(record):
+            if cno < len(record):
+                return low <= record[cno] <= high
+            else:
+                return False
+
+    return predicate
+
+def compile_list(cno, literals):
+
+    strings = frozenset(map(lambda x: x[0], literals))
+    numbers = frozenset(filter(lambda x: x is not None, map(lambda x: x[1], literals)))
+    def predicate(record):
+        if cno >= len(record):
+            return False
+        value = record[cno]
+        if value in strings:
+            return True
+        if len(numbers) > 0:
+            try:
+                return float(value) in numbers
+            except ValueError:
+                return False
+        return False
+
+    return predicate
+
+class Parser():
+
+    def __init__(self, exp):
+        self.tokens = tokenize(exp)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        else:
+            return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError('Unexpected end of expression')
+        self.pos = self.pos + 1
+        return token
+
+    def accept(self, kind, value):
+        if self.peek() == (kind, value):
+            self.pos = self.pos + 1
+            return True
+        else:
+            return False
+
+    def expect(self, kind, value):
+        if not self.accept(kind, value):
+            raise ValueError(f'Expected \'{value}\' but found \'{self.peek()[1]}\'')
+
+    def literal(self):
+        kind, value = self.next()
+        if kind == 'literal':
+            return value, None
+        elif kind == 'word':
+            return value, to_number(value)
+        else:
+            raise ValueError(f'Expected value but found \'{value}\'')
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.peek()[0] is not None:
+            raise ValueError(f'Unexpected token \'{self.peek()[1]}\'')
+        return predicate
+
+    def parse_or(self):
+        predicates = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            predicates.append(self.parse_and())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda record: any(p(record) for p in predicates)
+
+    def parse_and(self):
+        predicates = [self.parse_not()]
+        while self.accept('keyword', 'and'):
+            predicates.append(self.parse_not())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda record: all(p(record) for p in predicates)
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            predicate = self.parse_not()
+            return lambda record: not predicate(record)
+        else:
+            return self.parse_primary()
+
+    def parse_primary(self):
+        if self.accept('op', '('):
+            predicate = self.parse_or()
+            self.expect('op', ')')
+            return predicate
+
+        kind, column = self.next()
+        cno = columnexp2number(column) if kind == 'word' and column.isalpha() else None
+        if cno is None:
+            raise ValueError(f'Invalid column \'{column}\'')
+
+        kind, op = self.next()
+        if kind == 'op' and op in COMPARISON_OPERATORS:
+            return compile_comparison(cno, op, self.literal())
+        elif kind == 'op' and op in ['~', '!~']:
+            try:
+                return compile_regex(cno, self.literal(), op == '!~')
+            except re.error as e:
+                raise ValueError(f'Invalid regular expression: {e}')
+        elif (kind, op) == ('keyword', 'not'):
+            self.expect('keyword', 'in')
+            predicate = self.parse_in(cno)
+            return lambda record: cno < len(record) and not predicate(record)
+        elif (kind, op) == ('keyword', 'in'):
+            return self.parse_in(cno)
+        else:
+            raise ValueError(f'Invalid operator \'{op}\'')
+
+    def parse_in(self, cno):
+        if self.accept('op', '('):
+            literals = [self.literal()]
+            while self.accept('op', ','):
+                literals.append(self.literal())
+            self.expect('op', ')')
+            return compile_list(cno, literals)
+        else:
+            low = self.literal()
+            self.expect('op', '..')
+            high = self.literal()
+            return compile_range(cno, low, high)
+
+class WhereExpression():
+
+    def __init__(self, exp):
+        self.exp = exp
+        self.predicate = Parser(exp).parse()
+
+    def __call__(self, record):
+        return self.predicate(record)
+
+    def __getstate__(self):
+        return { 'exp': self.exp }
+
+    def __setstate__(self, state):
+        self.__init__(state['exp'])
+
+def compile_where(exp):
+    return WhereExpression(exp)
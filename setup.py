@@ -20,7 +20,8 @@ setup(
         'console_scripts': [
             'opdselect=opdutil.opdselect:main',
             'opddetect=opdutil.opddetect:main',
-            'opdlist=opdutil.opdlist:main'
+            'opdlist=opdutil.opdlist:main',
+            'opdjoin=opdutil.opdjoin:main'
         ]
     },
     zip_safe=False